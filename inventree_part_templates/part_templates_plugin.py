@@ -9,8 +9,8 @@
 # Typing
 from typing import Dict, Any, List
 
-# Error reporting assistance
-import traceback
+# Caching of compiled templates
+from functools import lru_cache
 
 # Translation support
 from django.utils.translation import gettext_lazy as _
@@ -44,6 +44,20 @@ from .version import PLUGIN_VERSION
 from django.contrib.auth.models import User
 from typing import cast
 
+@lru_cache(maxsize=256)
+def _compile_template(template: str) -> Template:
+    """
+    Compiles a context template into a Django template, caching the result as the same few templates
+    are typically applied to every part in a report or label run.
+
+    Args:
+        template (str): The template string to compile.
+
+    Returns:
+        Template: The compiled Django template, with the template tag libraries loaded.
+    """
+    return Template("{% load barcode report part_templates %}" + template)
+
 class PartTemplatesPlugin(AppMixin, PanelMixin, UrlsMixin, ReportMixin, SettingsMixin, InvenTreePlugin):
     """
     A plugin for InvenTree that extends reporting with customizable part / category templates.
@@ -258,15 +272,18 @@ class PartTemplatesPlugin(AppMixin, PanelMixin, UrlsMixin, ReportMixin, Settings
         """
         context: List[Dict[str, str]] = []
 
+        # the parent categories are used to pick up what would be the inherited template if this
+        # does not override it, and are only fetched once a key needs them
+        parent_categories: List[PartCategory] | None = None
+
         # process each possible key from settings
         for key_number in range(1, self.MAX_TEMPLATES + 1):
             key: str = self.get_setting(f'T{key_number}_KEY')
+            # skip keys the user has not defined (context variable name)
+            if not key:
+                continue
             default_template: str = self.get_setting(f'T{key_number}_TEMPLATE')
 
-            # determine the parent category so we can pick up what would be the inherited template
-            # if this does not override it
-            parent_category = instance.category if isinstance(instance, Part) else instance.parent
-
             # get the template metadata, which is a dictionary of context_name: template for this instance
             #instance = Part.objects.get(pk=instance.pk)
             if instance.metadata and instance.metadata.get(self.METADATA_PARENT) and instance.metadata[self.METADATA_PARENT].get(self.METADATA_TEMPLATE_KEY):
@@ -279,7 +296,9 @@ class PartTemplatesPlugin(AppMixin, PanelMixin, UrlsMixin, ReportMixin, Settings
 
             # get the inherited template (ignoring our current template, this is what it would be if
             # the template on this instance was not defined)
-            inherited_template = self._find_category_template(parent_category, key, default_template)
+            if parent_categories is None:
+                parent_categories = self._get_categories(instance.category if isinstance(instance, Part) else instance.parent)
+            inherited_template = self._find_category_template(parent_categories, key, default_template)
 
             # render the part using the context if we have one
             rendered_template = ""
@@ -289,16 +308,14 @@ class PartTemplatesPlugin(AppMixin, PanelMixin, UrlsMixin, ReportMixin, Settings
                 except Exception as e:      # pylint: disable=broad-except
                     rendered_template = f'({_("error")}: {str(e)})'
 
-            # if the user has defined a key (context variable name), add to our context
-            if key:
-                context.append({
-                    'key': key,
-                    'template': template,
-                    'inherited_template': inherited_template,
-                    'rendered_template': rendered_template,
-                    'entity': 'part' if isinstance(instance, Part) else 'category',
-                    'pk': instance.pk,
-                })
+            context.append({
+                'key': key,
+                'template': template,
+                'inherited_template': inherited_template,
+                'rendered_template': rendered_template,
+                'entity': 'part' if isinstance(instance, Part) else 'category',
+                'pk': instance.pk,
+            })
 
         return context
 
@@ -460,6 +477,9 @@ class PartTemplatesPlugin(AppMixin, PanelMixin, UrlsMixin, ReportMixin, Settings
             # set up an empty context
             context[self.CONTEXT_KEY] = {}
 
+            # the category heirarchy is fetched once, when the first key falls through to it
+            categories: List[PartCategory] | None = None
+
             # process each possible key from settings
             for key_number in range(1, self.MAX_TEMPLATES + 1):
                 key: str = self.get_setting(f'T{key_number}_KEY')
@@ -467,15 +487,24 @@ class PartTemplatesPlugin(AppMixin, PanelMixin, UrlsMixin, ReportMixin, Settings
                 # if the user has defined a key (context variable name), process this template
                 if key:
                     # find the best template between part and the category metadata heirarchy
-                    found_template = self._find_template(part, key, default_template)
+                    found_template = self._find_part_template(part, key)
+                    if not found_template:
+                        if categories is None:
+                            categories = self._get_categories(part.category)
+                        found_template = self._find_category_template(categories, key, default_template)
                     stock: StockItem | None = instance if isinstance(instance, StockItem) else None
                     try:
                         result = self._apply_template(part, stock, found_template)
                     except Exception as e:      # pylint: disable=broad-except
-                        tb = traceback.extract_tb(e.__traceback__)
-                        last_call = tb[-1]
+                        # find where the error was raised (walking the traceback directly, as
+                        # traceback.extract_tb reads the source file of every frame)
+                        last_call = e.__traceback__
+                        while last_call.tb_next:
+                            last_call = last_call.tb_next
+                        filename = last_call.tb_frame.f_code.co_filename
+                        lineno = last_call.tb_lineno
                         context[self.CONTEXT_KEY] = {
-                                'error': _("Template error for {key} with \"{found_template}\": '{error}' {last_call.filename}:{last_call.lineno}").format(key=key, found_template=found_template, error=str(e), last_call=last_call)
+                                'error': _("Template error for {key} with \"{found_template}\": '{error}' {filename}:{lineno}").format(key=key, found_template=found_template, error=str(e), filename=filename, lineno=lineno)
                         }
                         return
 
@@ -524,53 +553,63 @@ class PartTemplatesPlugin(AppMixin, PanelMixin, UrlsMixin, ReportMixin, Settings
         }
 
         # set up the Django template
-        django_template = Template("{% load barcode report part_templates %}" + template)
+        django_template = _compile_template(template)
         # create the template context
         context = Context(template_data)
         # format the template
         return django_template.render(context)
 
-    def _find_template(self, part: Part, key: str, default_template: str) -> str:
+    def _find_part_template(self, part: Part, key: str) -> str | None:
         """
-        Find the template for a given part and key.  Starts by checking if the part has
-        metadata and specifically this key.  If not, it walks up the category tree to find
-        the first category with metadata and this key.  If none found, it uses the default
-        template.
+        Find the template for a given part and key in the part's own metadata.  If not found, the
+        caller walks up the category tree (see _find_category_template) to find the first category
+        with metadata and this key, or uses the default template.
 
         Args:
             part (Part): The part for which to find the template.
             key (str): The key to search for in the part's metadata.
-            default_template (str): The default template to use if the key is not found.
 
         Returns:
-            str: The template found for the given part and key, or the default template if not found.
+            str | None: The template found for the given part and key, or None if not found.
         """
         # does our part have our metadata?
         if part.metadata and part.metadata.get(self.METADATA_PARENT) and part.metadata[self.METADATA_PARENT].get(self.METADATA_TEMPLATE_KEY) and part.metadata[self.METADATA_PARENT][self.METADATA_TEMPLATE_KEY].get(key):
             return part.metadata[self.METADATA_PARENT][self.METADATA_TEMPLATE_KEY][key]
+        return None
 
-        # not on part, so walk up the category tree
-        return self._find_category_template(part.category, key, default_template)
-
-    def _find_category_template(self, category: PartCategory, key: str, default_template: str) -> str:
+    def _find_category_template(self, categories: List[PartCategory], key: str, default_template: str) -> str:
         """
-        Recursively searches for a template associated with a given category and key.
+        Searches a category and its ancestors, nearest first, for a template associated with the key.
 
         Args:
-            category (PartCategory): The category to start the search from.
+            categories (List[PartCategory]): The category to start the search from, followed by
+                its ancestors (see _get_categories).
             key (str): The key to search for in the category's metadata.
             default_template (str): The default template to return if no template is found.
 
         Returns:
             str: The template associated with the category and key, or the default template if not found.
         """
-        # if no category, return default
-        if not category:
-            return default_template
+        for category in categories:
+            # if we have metadata with our key, use that as the template
+            if category.metadata and category.metadata.get(self.METADATA_PARENT) and category.metadata[self.METADATA_PARENT].get(self.METADATA_TEMPLATE_KEY) and category.metadata[self.METADATA_PARENT][self.METADATA_TEMPLATE_KEY].get(key):
+                return category.metadata[self.METADATA_PARENT][self.METADATA_TEMPLATE_KEY][key]
 
-        # if we have metadata with our key, use that as the template
-        if category.metadata and category.metadata.get(self.METADATA_PARENT) and category.metadata[self.METADATA_PARENT].get(self.METADATA_TEMPLATE_KEY) and category.metadata[self.METADATA_PARENT][self.METADATA_TEMPLATE_KEY].get(key):
-            return category.metadata[self.METADATA_PARENT][self.METADATA_TEMPLATE_KEY][key]
+        # no template in the category tree, so use the default
+        return default_template
 
-        # no template, so walk up the category tree
-        return self._find_category_template(category.parent, key, default_template)
+    def _get_categories(self, category: PartCategory | None) -> List[PartCategory]:
+        """
+        Gets a category and all of its ancestors, nearest first, using a single query of the
+        category tree rather than a query per level of parent (and no query for a top level
+        category).
+
+        Args:
+            category (PartCategory | None): The category to start from.
+
+        Returns:
+            List[PartCategory]: The category followed by its ancestors, or an empty list if no category.
+        """
+        if not category:
+            return []
+        return [category, *category.get_ancestors(ascending=True)]
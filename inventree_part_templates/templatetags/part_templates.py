@@ -7,29 +7,35 @@
 
 # for regex
 import re
+from functools import lru_cache, partial
+
+# for reporting disabled rules
+import logging
 
 # For reading YAML config file
 import os
+import json
+import time
 import yaml
 from pathlib import Path
 
+# use the LibYAML C parser when available, as it is considerably faster than the pure Python one
+try:
+    from yaml import CSafeLoader as _SafeLoader
+except ImportError:
+    from yaml import SafeLoader as _SafeLoader  # type: ignore[assignment]
+
 # To add Django filters / tags
 from django import template
 
 # Translation support
 from django.utils.translation import gettext_lazy as _
 
-# caching of the YAML data
-from django.core.cache import cache
-
 # for context in filters
 from django.template import Context
 
 # type hinting
-from typing import Dict, List, Union
-
-# set how long we cache the config data (in seconds), to allow users to edit it without restarting the server
-CACHE_TIMEOUT = 3
+from typing import Any, Callable, Dict, List, NamedTuple, Tuple, Union
 
 # define the types for the yaml config file
 FilterRule = Dict[str, str]
@@ -37,37 +43,328 @@ FilterRules = List[FilterRule]
 Filters = Dict[str, FilterRules]
 Config = Dict[str, Filters]
 
+class RuleSetError(NamedTuple):
+    """
+    A rule set that failed validation, holding the (lazily translated) error message and its format
+    arguments, so the message is translated into the active language each time it is returned.
+    """
+    message: str
+    arguments: Dict[str, str]
+
+    def format(self) -> str:
+        """Formats the error message in the active language."""
+        return self.message.format(**self.arguments)
+
+# define the types for the compiled filters, where each rule is a function that applies it to a value
+# and a rule set that fails validation is replaced by the error to return when it is used
+CompiledRule = Callable[[str], str]
+CompiledRuleSet = Union[Tuple[CompiledRule, ...], RuleSetError]
+CompiledFilters = Dict[str, CompiledRuleSet]
+
 # define register so that Django can find the tags/filters
 register = template.Library()
 
+# error messages returned in place of the scrubbed value (defined once, as lazy translations)
+_ERR_MISSING_NAME = _('[scrub missing required :name]')
+_ERR_CONFIG_NOT_FOUND = _('["part_templates.yaml" not found: {error}]')
+_ERR_CONFIG_INVALID = _("[Error in configuration file: {error}]")
+_ERR_MISSING_FILTERS = _('["filters" not found in "parts_templates.yaml"]')
+_ERR_MISSING_PATTERN = _('["pattern" not found in "{name}" in "parts_templates.yaml"]')
+_ERR_MISSING_REPLACEMENT = _('["replacement" not found in "{name}" in "parts_templates.yaml"]')
+_ERR_INVALID_RULES = _('["{name}" is not a list of rules in "parts_templates.yaml"]')
+_ERR_INVALID_RULE = _('["pattern" and "replacement" must be strings in "{name}" in "parts_templates.yaml"]')
+_ERR_REGEX = _('["{name}" regex error on {pattern}: {error}]')
+
+# set the path to the config file using environment variable PART_TEPLATES_CONFIG_FILE, or get from
+# the plugin directory if not set (resolved once, as neither changes while the server is running)
+_CFG_FILENAME: Path = (Path(os.environ['PART_TEMPLATES_CONFIG_FILE'].strip()).resolve()
+                       if os.getenv('PART_TEMPLATES_CONFIG_FILE')
+                       else Path(__file__).parent.parent.joinpath('part_templates.yaml').resolve())
+
+# characters that give a scrub rule pattern a regex meaning; patterns without any are plain text
+_REGEX_METACHARACTERS = re.compile(r'[\\^$.|?*+()\[\]{}]')
+
+# InvenTree server log
+logger = logging.getLogger('inventree')
+
+# set how long we use the cached config data (in seconds) before checking if the file has changed, to
+# allow users to edit it without restarting the server
+CACHE_TIMEOUT = 3
+
+# in-process cache of the compiled filters, keyed by config file path and validated against the
+# file's modification time and size: (checked at, st_mtime_ns, st_size, compiled filters)
+_FILTER_CACHE: Dict[Path, Tuple[float, int, int, CompiledFilters | None]] = {}
 
-def load_filters() -> Config:
+
+def load_filters() -> CompiledFilters | None:
     """
-    Provides the filters from the configuration file, from cache or by loading the file.  The file
-    path and name can be defined in the environment variable PART_TEMPLATES_CONFIG_FILE, or it will
-    default to 'part_templates.yaml' in the inventree-part-templates plugin directory.
+    Provides the compiled filters from the configuration file, from cache or by loading the file.
+    The file path and name can be defined in the environment variable PART_TEMPLATES_CONFIG_FILE,
+    or it will default to 'part_templates.yaml' in the inventree-part-templates plugin directory.
+    The file is checked for changes at most every CACHE_TIMEOUT seconds, and is only reloaded (and
+    its rules compiled) when its modification time or size has changed.
 
     Returns:
-        Config: The loaded filters from the configuration file.
-    """
-    # do we have config cached?
-    filters = cache.get('part-templates-yaml')
-    if not filters:
-        # set the path to the config file using environment variable PART_TEPLATES_CONFIG_FILE, or
-        # get from the plugin directory if not set
-        cfg_filename = os.getenv('PART_TEMPLATES_CONFIG_FILE')
-        if cfg_filename:
-            cfg_filename = Path(cfg_filename.strip()).resolve()
+        CompiledFilters | None: The compiled rule sets by name, or None if the configuration file
+        has no "filters" section.
+
+    Raises:
+        FileNotFoundError: If the configuration file is not found.
+        yaml.YAMLError: If there is an error in the configuration file.
+    """
+    cfg_filename = _CFG_FILENAME
+
+    # do we have config cached, and was it checked against the file recently enough?
+    now = time.monotonic()
+    cached = _FILTER_CACHE.get(cfg_filename)
+    if cached and now - cached[0] < CACHE_TIMEOUT:
+        return cached[3]
+
+    # is the cached config still current?
+    stat = cfg_filename.stat()
+    if cached and cached[1] == stat.st_mtime_ns and cached[2] == stat.st_size:
+        _FILTER_CACHE[cfg_filename] = (now, cached[1], cached[2], cached[3])
+        return cached[3]
+
+    # use the JSON sidecar from a previous load if it was built from this version of the file,
+    # otherwise load the config file and write a new sidecar for the next process to use
+    json_filename = cfg_filename.with_name(f'.{cfg_filename.name}.json')
+    found, config = _load_json_sidecar(json_filename, stat)
+    if not found:
+        # read as bytes and let the YAML parser decode them (UTF-8 unless the file has a BOM)
+        with open(cfg_filename, 'rb') as file:
+            config = yaml.load(file, Loader=_SafeLoader)
+        _save_json_sidecar(json_filename, stat, config)
+
+    # compile and cache the filters
+    filters = _compile_filters(config)
+    _FILTER_CACHE[cfg_filename] = (now, stat.st_mtime_ns, stat.st_size, filters)
+    return filters
+
+def _compile_filters(config: Config) -> CompiledFilters | None:
+    """
+    Validates and compiles every rule set in the config, so the work is done once per load of the
+    configuration file rather than on every filter call.  Each named rule set is followed by the
+    _GLOBAL rules, so scrub() only needs to apply a single rule set.
+
+    Args:
+        config (Config): The config loaded from the configuration file.
+
+    Returns:
+        CompiledFilters | None: The compiled rule sets by name, or None if the config has no
+        "filters" section.
+    """
+    filters = config.get('filters') if isinstance(config, dict) else None
+    if not isinstance(filters, dict):
+        return None
+
+    compiled = {name: _compile_rule_set(name, rules) for name, rules in filters.items()}
+    global_rules = compiled.get('_GLOBAL', ())
+    for name, rule_set in compiled.items():
+        # a rule set that failed to compile (or the _GLOBAL rules failing) holds the error
+        if name == '_GLOBAL' or isinstance(rule_set, RuleSetError):
+            continue
+        compiled[name] = global_rules if isinstance(global_rules, RuleSetError) else rule_set + global_rules
+    return compiled
+
+def _compile_rule_set(name: str, rules: FilterRules) -> CompiledRuleSet:
+    """
+    Compiles the rules of a single rule set, in order.
+
+    Args:
+        name (str): The name of the rule set, used in error messages.
+        rules (FilterRules): The rules from the configuration file.
+
+    Returns:
+        CompiledRuleSet: A tuple of compiled rules, or the error for the first invalid rule.
+    """
+    if rules is None:
+        return ()
+    if not isinstance(rules, list):
+        return RuleSetError(_ERR_INVALID_RULES, {'name': name})
+
+    compiled: List[CompiledRule] = []
+    for rule in rules:
+        pattern = rule.get('pattern') if isinstance(rule, dict) else None
+        if pattern is None:
+            return RuleSetError(_ERR_MISSING_PATTERN, {'name': name})
+        replacement = rule.get('replacement')
+        if replacement is None:
+            return RuleSetError(_ERR_MISSING_REPLACEMENT, {'name': name})
+        if not isinstance(pattern, str) or not isinstance(replacement, str):
+            return RuleSetError(_ERR_INVALID_RULE, {'name': name})
+
+        # skip (rather than fail the rule set on) patterns that can take an extremely long time to run
+        if _has_nested_quantifier(pattern):
+            logger.warning('part_templates.yaml: skipping "%s" rule "%s", as its nested quantifier can cause catastrophic backtracking', name, pattern)
+            continue
+
+        try:
+            compiled.append(_compile_rule(pattern, replacement))
+        except re.error as error:
+            return RuleSetError(_ERR_REGEX, {'name': name, 'pattern': pattern, 'error': str(error)})
+    return tuple(compiled)
+
+def _load_json_sidecar(json_filename: Path, stat: os.stat_result) -> Tuple[bool, Config | None]:
+    """
+    Loads the config from the JSON sidecar file, which is much faster to parse than YAML.  The
+    sidecar is only used if it was written from a config file with the same modification time and
+    size as the current one.
+
+    Args:
+        json_filename (Path): The path to the JSON sidecar file.
+        stat (os.stat_result): The stat result of the current config file.
+
+    Returns:
+        Tuple[bool, Config | None]: Whether a current sidecar was found, and the config it holds
+        (which is None for an empty config file).
+    """
+    try:
+        sidecar = json.loads(json_filename.read_bytes())
+    except (OSError, ValueError):
+        return False, None
+
+    if not isinstance(sidecar, dict) or 'config' not in sidecar or sidecar.get('mtime_ns') != stat.st_mtime_ns or sidecar.get('size') != stat.st_size:
+        return False, None
+    return True, sidecar['config']
+
+def _save_json_sidecar(json_filename: Path, stat: os.stat_result, filters: Config) -> None:
+    """
+    Writes the config to the JSON sidecar file, tagged with the modification time and size of the
+    config file it was built from.  The file is written to a temporary file and then moved into
+    place so other processes never see a partial file.  The sidecar is not written if the config
+    has keys that are not strings (such as a filter named 10), as JSON would turn them into strings
+    and processes loading the sidecar would see a different config.  Failures (such as a read-only
+    plugin directory, or YAML content that cannot be represented in JSON) are ignored, as the
+    sidecar is only an optimization.
+
+    Args:
+        json_filename (Path): The path to the JSON sidecar file.
+        stat (os.stat_result): The stat result of the config file that was loaded.
+        filters (Config): The loaded config.
+    """
+    if not _has_only_str_keys(filters):
+        return
+
+    temp_filename = json_filename.with_name(f'{json_filename.name}.{os.getpid()}.tmp')
+    try:
+        temp_filename.write_text(json.dumps({'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'config': filters}), encoding='utf-8')
+        os.replace(temp_filename, json_filename)
+    except (OSError, TypeError, ValueError):
+        try:
+            temp_filename.unlink()
+        except OSError:
+            pass
+
+def _has_nested_quantifier(pattern: str) -> bool:
+    """
+    Checks if a pattern repeats without an upper bound (with +, * or {n,}) a group that itself
+    contains a repeat and can end in a variable length match, such as "(a+)+", "(a+){2,}" or
+    "((a+))+".  These can backtrack exponentially on long values that almost match.  Groups that end
+    with a fixed match, such as "(\\d+,)*", bounded repeats such as "(\\d+\\.){3}", and atomic
+    groups "(?>...)" are not flagged.  This is a heuristic, so it does not catch every pattern that
+    can backtrack badly.
+
+    Args:
+        pattern (str): The regex pattern from the configuration file.
+
+    Returns:
+        bool: True if the pattern has a nested quantifier.
+    """
+    # for each open group (the pattern itself being the outermost): whether it contains a repeat,
+    # whether the current alternative ends in a variable length match, whether any earlier
+    # alternative did, and whether the group is atomic
+    groups = [[False, False, False, False]]
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        group = groups[-1]
+        if char == '\\':
+            # escaped character or class, a fixed length match
+            group[1] = False
+            i += 2
+        elif char == '[':
+            # character set, a fixed length match (a leading "^" or "]" is part of the set)
+            i += 1
+            if i < len(pattern) and pattern[i] == '^':
+                i += 1
+            if i < len(pattern) and pattern[i] == ']':
+                i += 1
+            while i < len(pattern) and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+            group[1] = False
+            i += 1
+        elif char == '(':
+            groups.append([False, False, False, pattern.startswith('(?>', i)])
+            # skip the "?" of extension groups such as "(?:", so it is not taken as a quantifier
+            i += 2 if pattern.startswith('(?', i) else 1
+        elif char == ')' and len(groups) > 1:
+            inner = groups.pop()
+            ends_variable = inner[1] or inner[2]
+            unbounded = pattern[i + 1:i + 2] in ('+', '*') or re.match(r'\{\d*,\}', pattern[i + 1:])
+            if unbounded and inner[0] and ends_variable and not inner[3]:
+                return True
+            # an atomic group never gives back what it matched, so does not backtrack into its repeats
+            if not inner[3]:
+                groups[-1][0] = groups[-1][0] or inner[0]
+            groups[-1][1] = ends_variable and not inner[3]
+            i += 1
+        elif char == '|':
+            group[2] = group[2] or group[1]
+            group[1] = False
+            i += 1
+        elif char in '+*?':
+            # a quantifier (or lazy modifier) makes the previous match variable length
+            group[0] = group[0] or char != '?'
+            group[1] = True
+            i += 1
+        elif char == '{' and re.match(r'\{\d*,\d*\}', pattern[i:]):
+            # a ranged repeat such as {1,3}, also a variable length match
+            group[0] = True
+            group[1] = True
+            i = pattern.index('}', i) + 1
         else:
-            cfg_filename = Path(__file__).parent.parent.joinpath('part_templates.yaml').resolve()
+            group[1] = False
+            i += 1
+    return False
 
-        # load the config file
-        with open(cfg_filename, 'r', encoding='utf-8') as file:
-            filters = yaml.safe_load(file)
+def _has_only_str_keys(data: Any) -> bool:
+    """
+    Checks that every dictionary key in loaded YAML data is a string, so it survives a JSON round trip.
 
-        # cache the config data
-        cache.set('part-templates-yaml', filters, timeout=CACHE_TIMEOUT)
-    return filters
+    Args:
+        data (Any): The loaded YAML data.
+
+    Returns:
+        bool: True if all keys, at any depth, are strings.
+    """
+    if isinstance(data, dict):
+        return all(isinstance(key, str) and _has_only_str_keys(value) for key, value in data.items())
+    if isinstance(data, list):
+        return all(_has_only_str_keys(value) for value in data)
+    return True
+
+@lru_cache(maxsize=256)
+def _compile_rule(pattern: str, replacement: str) -> Callable[[str], str]:
+    """
+    Compiles a scrub rule into a function that applies it to a value, caching the result so each
+    rule from the configuration file is only compiled once rather than on every filter call.  Rules
+    that are plain text (no regex metacharacters in the pattern and no backslash escapes in the
+    replacement) use str.replace, which avoids the regex engine entirely.
+
+    Args:
+        pattern (str): The regex pattern from the configuration file.
+        replacement (str): The replacement string from the configuration file.
+
+    Returns:
+        Callable[[str], str]: A function that applies the rule to a value.
+
+    Raises:
+        re.error: If the pattern is not a valid regex.
+    """
+    if not _REGEX_METACHARACTERS.search(pattern) and '\\' not in replacement:
+        return lambda value: value.replace(pattern, replacement)
+    return partial(re.compile(pattern).sub, replacement)
 
 @register.filter()
 def scrub(value: str, name: str) -> str:
@@ -90,55 +387,34 @@ def scrub(value: str, name: str) -> str:
 
     """
     if not name:
-        return _('[scrub missing required :name]')
+        return _ERR_MISSING_NAME
+
+    # nothing to scrub, so skip loading the config
+    if not value:
+        return value
 
     try:
-        config = load_filters()
+        filters = load_filters()
     except FileNotFoundError as error:
-        return (_('["part_templates.yaml" not found: {error}]').format(error=str(error)))
+        return _ERR_CONFIG_NOT_FOUND.format(error=str(error))
     except yaml.YAMLError as error:
-        return (_("[Error in configuration file: {error}]").format(error=str(error)))
+        return _ERR_CONFIG_INVALID.format(error=str(error))
 
-    filters = config.get('filters')
     if filters is None:
-        return _('["filters" not found in "parts_templates.yaml"]')
-    
-    # see if we have a set of rules for this key
-    rules = filters.get(name)
-    if rules is None:
-        # return _('["{name}" not found in "parts_templates.yaml"]').format(name=name)
-        return value
+        return _ERR_MISSING_FILTERS
 
-    # process all rules for this specific key
-    for rule in rules:
-        pattern = rule.get('pattern')
-        if pattern is None:
-            return _('["pattern" not found in "{name}" in "parts_templates.yaml"]').format(name=name)
-        replacement = rule.get('replacement')
-        if replacement is None:
-            return _('["replacement" not found in "{name}" in "parts_templates.yaml"]').format(name=name)
+    # process all rules for this specific key, which include the _GLOBAL rules, or only the _GLOBAL
+    # rules if there are none for this key
+    rule_set = filters.get(name)
+    if rule_set is None:
+        rule_set = filters.get('_GLOBAL', ())
+
+    # a rule set that failed to compile holds its error
+    if isinstance(rule_set, RuleSetError):
+        return rule_set.format()
+    for rule in rule_set:
+        value = rule(value)
 
-        try:
-            value = re.sub(pattern, replacement, value)
-        except re.error as error:
-            return _('["{name}" regex error on {pattern}: {error}]').format(name=name, pattern=pattern, error=str(error))
-
-    # see if we have a _GLOBAL rule set
-    global_rules = filters.get('_GLOBAL')
-    if global_rules is not None:
-        for rule in global_rules:
-            pattern = rule.get('pattern')
-            if pattern is None:
-                return _('["pattern" not found in "_GLOBAL" in "parts_templates.yaml"]')
-            replacement = rule.get('replacement')
-            if replacement is None:
-                return _('["replacement" not found in "_GLOBAL" in "parts_templates.yaml"]')
-
-            try:
-                value = re.sub(pattern, replacement, value)
-            except re.error as error:
-                return _('["_GLOBAL regex error on {pattern}: {error}]').format(pattern=pattern, error=str(error))
-            
     return value
 
 @register.filter()
@@ -148,10 +424,9 @@ def value(properties: Dict[str, str], key: str) -> str | None:
     Example:
     {% parameters|value:"Rated Voltage" %}
     """
-    try:
-        return properties.get(key)
-    except Exception:       # pylint: disable=broad-except
+    if not isinstance(properties, dict):
         return ""
+    return properties.get(key)
 
 @register.filter()
 def item(properties: Dict[str, str], key: str) -> str | None:
@@ -160,11 +435,10 @@ def item(properties: Dict[str, str], key: str) -> str | None:
     Example:
     {% parameters|item:"Package Type" %}
     """
-    try:
-        value = properties.get(key)
-    except Exception:       # pylint: disable=broad-except
+    if not isinstance(properties, dict):
         return ""
 
+    value = properties.get(key)
     if value:
         return scrub(value, key)
     return ""